@@ -1,11 +1,19 @@
-import os
 from dotenv import load_dotenv
-from pydantic_settings import BaseSettings
+from pydantic import ValidationInfo, field_validator
+from pydantic_settings import BaseSettings, SettingsConfigDict
 import re
 from loguru import logger
 
 load_dotenv()
 
+# Expected key formats. A mismatch is only logged: real keys don't always
+# follow these (e.g. longer gsk_ keys), so the raw value is kept as-is.
+API_KEY_PATTERNS = {
+    "GROQ_API_KEY": r"^gsk_[A-Za-z0-9]{48}$",
+    "OPENAI_API_KEY": r"^sk-(?:proj-)?[A-Za-z0-9-_]{48,}$",
+    "ELEVENLABS_API_KEY": r"^[A-Za-z0-9]{32}$",
+}
+
 def validate_api_key(api_key: str, pattern: str, name: str) -> str:
     """Validate API key format and return valid key or empty string"""
     if not api_key:
@@ -19,6 +27,15 @@ def validate_api_key(api_key: str, pattern: str, name: str) -> str:
         return ""
 
 class Settings(BaseSettings):
+    # Env vars and .env are read once by pydantic-settings; frozen keeps the
+    # instance immutable (and hashable) for the rest of the process.
+    model_config = SettingsConfigDict(
+        env_file=".env",
+        extra="ignore", # Allow extra env variables
+        frozen=True,
+        validate_default=True
+    )
+    
     # Core
     APP_NAME: str = "Tiryaq Voice SaaS"
     ENV: str = "production"
@@ -26,27 +43,20 @@ class Settings(BaseSettings):
     PORT: int = 8000
     
     # API Keys
-    GROQ_API_KEY: str = validate_api_key(
-        os.getenv("GROQ_API_KEY", ""), 
-        r"^gsk_[A-Za-z0-9]{48}$",
-        "GROQ_API_KEY"
-    )
-    
-    OPENAI_API_KEY: str = validate_api_key(
-        os.getenv("OPENAI_API_KEY", ""), 
-        r"^sk-(?:proj-)?[A-Za-z0-9-_]{48,}$",
-        "OPENAI_API_KEY"
-    )
-    
-    ELEVENLABS_API_KEY: str = validate_api_key(
-        os.getenv("ELEVENLABS_API_KEY", ""), 
-        r"^[A-Za-z0-9]{32}$",
-        "ELEVENLABS_API_KEY"
-    )
+    GROQ_API_KEY: str = ""
+    OPENAI_API_KEY: str = ""
+    ELEVENLABS_API_KEY: str = ""
     
     # Firebase / Firestore
-    FIRESTORE_PROJECT_ID: str = os.getenv("FIRESTORE_PROJECT_ID", "")
-    GOOGLE_APPLICATION_CREDENTIALS: str = os.getenv("GOOGLE_APPLICATION_CREDENTIALS", "")
+    FIRESTORE_PROJECT_ID: str = ""
+    GOOGLE_APPLICATION_CREDENTIALS: str = ""
+    
+    @field_validator(*API_KEY_PATTERNS)
+    @classmethod
+    def _validate_api_key_format(cls, value: str, info: ValidationInfo) -> str:
+        # Warn-only: DUMMY_MODE depends on presence, never on format
+        validate_api_key(value, API_KEY_PATTERNS[info.field_name], info.field_name)
+        return value
     
     # Dummy Mode (auto-enabled when API keys are invalid)
     @property
@@ -58,9 +68,5 @@ class Settings(BaseSettings):
     DEFAULT_PERSONA_PATH: str = "personas/tiryaq.json"
     SAMPLE_RATE: int = 16000
     VAD_SENSITIVITY: int = 3 # 1-3
-    
-    class Config:
-        env_file = ".env"
-        extra = "ignore" # Allow extra env variables
 
 settings = Settings()
@@ -5,17 +5,16 @@ Version: 9.0.0 - Dependency Hell Fix
 """
 
 import asyncio
-import json
+import io
 import struct
-import math
 import time
-import wave
-import tempfile
 import os
 import sys
 import traceback
 import functools
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, Optional
+from contextlib import aclosing, asynccontextmanager
 from contextvars import ContextVar
 from pathlib import Path
 
@@ -24,6 +23,7 @@ BACKEND_DIR = Path(__file__).parent.resolve()
 if str(BACKEND_DIR) not in sys.path:
     sys.path.insert(0, str(BACKEND_DIR))
 
+import orjson
 from openai import OpenAI
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
@@ -31,8 +31,15 @@ from fastapi.responses import FileResponse, JSONResponse
 from fastapi.staticfiles import StaticFiles
 from loguru import logger
 
-from services.agent_engine import GroqEngine
+from services.agent_engine import (
+    GroqEngine,
+    close_http_clients,
+    get_groq_client,
+    get_tts_client,
+    preload_tenant_dbs,
+)
 from services.firestore_memory import MemoryManager
+from services.rms_kernel import rms_i16, warmup as warmup_rms_kernel
 from config import settings
 
 # ================= Logging =================
@@ -46,14 +53,64 @@ logger.add(
     retention="7 days",
     level=settings.LOG_LEVEL,
     format="{time:YYYY-MM-DD HH:mm:ss.SSS} | {level:<8} | {message}",
-    enqueue=True  # Thread-safe logging
+    enqueue=True,  # Thread-safe logging
+    diagnose=settings.ENV != "production"  # Skip variable-annotated tracebacks in prod
 )
 
 # ================= App Initialization =================
+async def _warmup(state):
+    """Cold-start work done once per process instead of on the first user turn."""
+    # Tenant knowledge bases: parse into the engine's lru_cache
+    loaded = await asyncio.to_thread(preload_tenant_dbs)
+    logger.info(f"Preloaded {loaded} tenant DB(s)")
+
+    # Vendor pools: open TCP+TLS so the first request reuses a hot connection
+    probes = {"elevenlabs": state.tts_http.head("https://api.elevenlabs.io")}
+    if state.groq:
+        probes["groq"] = state.groq.models.list()
+    if state.openai:
+        probes["openai"] = asyncio.to_thread(state.openai.models.list)
+
+    results = await asyncio.gather(
+        *(asyncio.wait_for(p, timeout=5.0) for p in probes.values()),
+        return_exceptions=True
+    )
+    for name, result in zip(probes, results):
+        if isinstance(result, Exception):
+            logger.warning(f"Prewarm {name} failed: {result!r}")
+        else:
+            logger.info(f"Prewarmed {name} connection pool")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global STT_POOL
+    # Shared vendor clients live for the whole process, not per session
+    app.state.tts_http = get_tts_client()
+    app.state.groq = get_groq_client(settings.GROQ_API_KEY) if settings.GROQ_API_KEY else None
+    app.state.openai = _get_openai(settings.OPENAI_API_KEY) if settings.OPENAI_API_KEY else None
+    await _warmup(app.state)
+
+    yield
+
+    await memory_manager.flush()
+    await close_http_clients()
+    if app.state.groq:
+        await app.state.groq.close()
+    if app.state.openai:
+        app.state.openai.close()
+    # Drop the closed clients so a later lifespan in this process builds fresh ones
+    get_groq_client.cache_clear()
+    _get_openai.cache_clear()
+    STT_POOL.shutdown(wait=False, cancel_futures=True)
+    STT_POOL = _new_stt_pool()  # spawns no threads until used
+
+
 app = FastAPI(
     title="Tiryaq Voice Elite",
     version="9.0.0",
-    description="SaaS-grade Voice Assistant - Najm AI Standard"
+    description="SaaS-grade Voice Assistant - Najm AI Standard",
+    lifespan=lifespan
 )
 
 # Mounting static files for unified deployment
@@ -63,25 +120,26 @@ STATIC_DIRS = [
     BACKEND_DIR.parent / "frontend",
 ]
 
-for static_dir in STATIC_DIRS:
-    if static_dir.exists():
-        app.mount("/static", StaticFiles(directory=str(static_dir)), name="static")
-        logger.info(f"Static files mounted from: {static_dir}")
-        break
+# Resolved once at import - no stat() calls per request
+STATIC_DIR: Optional[Path] = next((d for d in STATIC_DIRS if d.exists()), None)
+
+if STATIC_DIR:
+    app.mount("/static", StaticFiles(directory=str(STATIC_DIR)), name="static")
+    logger.info(f"Static files mounted from: {STATIC_DIR}")
+
+INDEX_SEARCH_PATHS = [
+    "/app/frontend/voice_assistant_v3.html",
+    str(BACKEND_DIR.parent / "frontend" / "voice_assistant_v3.html"),
+    "voice_assistant_v3.html",
+]
+INDEX_PATH: Optional[str] = next((p for p in INDEX_SEARCH_PATHS if Path(p).exists()), None)
 
 # ================= Routes =================
 @app.get("/")
 async def get_index():
     """Elite Guard: Unified Static Discovery with fallback"""
-    search_paths = [
-        "/app/frontend/voice_assistant_v3.html",
-        str(BACKEND_DIR.parent / "frontend" / "voice_assistant_v3.html"),
-        "voice_assistant_v3.html",
-    ]
-    
-    for path in search_paths:
-        if Path(path).exists():
-            return FileResponse(path, media_type="text/html")
+    if INDEX_PATH:
+        return FileResponse(INDEX_PATH, media_type="text/html")
     
     return JSONResponse({
         "message": "Tiryaq Elite V9.0 is running",
@@ -132,6 +190,7 @@ app.add_middleware(
 # Note: We don't initialize a global engine here anymore to support multiple tenants dynamically.
 # Each tenant will have its own engine instance during the session for proper persona isolation.
 memory_manager = MemoryManager()
+warmup_rms_kernel()
 request_id_var: ContextVar[str] = ContextVar("request_id", default="unknown")
 
 # ================= Audio / VAD Constants (Elite V8.2 Calibrated) =================
@@ -139,6 +198,7 @@ SAMPLE_RATE = 16000
 VOICE_THRESHOLD = 500   # Increased for noisy environments
 SILENCE_THRESHOLD = 200  # Increased to filter background noise
 SILENCE_DURATION_LIMIT = 2.0  # Longer silence detection for better phrase capture
+SILENCE_SAMPLES_LIMIT = int(SILENCE_DURATION_LIMIT * SAMPLE_RATE)  # Same limit, counted in audio samples
 MIN_SPEECH_DURATION = 0.5    
 MIN_BUFFER_SIZE = 12000   # Minimum 750ms of audio buffer for better quality
 
@@ -161,13 +221,7 @@ class SessionState:
 
 # ================= Utilities =================
 def calculate_rms(chunk: bytes) -> int:
-    if not chunk: return 0
-    count = len(chunk) // 2
-    try:
-        shorts = struct.unpack("<" + "h" * count, chunk)
-        return int(math.sqrt(sum(s * s for s in shorts) / count))
-    except Exception:
-        return 0
+    return rms_i16(chunk)
 
 
 class LatencyTracker:
@@ -181,49 +235,62 @@ class LatencyTracker:
     def __exit__(self, *args):
         duration = (time.time() - self.start) * 1000
         logger.bind(request_id=request_id_var.get()).info(
-            f"{self.phase}: {duration:.2f}ms"
+            "{}: {:.2f}ms", self.phase, duration
         )
 
 
 # ================= Speech-to-Text (STT) =================
+# Dedicated pool so slow Whisper uploads can't starve asyncio.to_thread users
+def _new_stt_pool() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=4, thread_name_prefix="stt")
+
+STT_POOL = _new_stt_pool()
+
+# Najm Standard: Anti-Hallucination Padding - 200ms of silence to ground Whisper
+_SILENCE_200MS = bytes(SAMPLE_RATE // 5 * 2)  # 200ms * 2 bytes/sample
+
+# Canonical 44-byte RIFF/WAVE header for mono PCM16; only the two sizes vary
+_WAV_HEADER = struct.pack(
+    "<4sI4s4sIHHIIHH4sI",
+    b"RIFF", 36, b"WAVE",
+    b"fmt ", 16, 1, 1, SAMPLE_RATE, SAMPLE_RATE * 2, 2, 16,
+    b"data", 0,
+)
+
+
+def _wav_header(data_size: int) -> bytearray:
+    header = bytearray(_WAV_HEADER)  # Copy: STT threads run concurrently
+    struct.pack_into("<I", header, 4, 36 + data_size)
+    struct.pack_into("<I", header, 40, data_size)
+    return header
+
+
+@functools.lru_cache(maxsize=4)
+def _get_openai(api_key: str) -> OpenAI:
+    """One pooled client per key - reuses TLS/keep-alive across utterances."""
+    return OpenAI(api_key=api_key, timeout=15, max_retries=0)
+
+
 def _transcribe_sync(audio: bytes, api_key: str) -> str:
-    path = None
     try:
-        # Najm Standard: Anti-Hallucination Padding
-        # Add 200ms of silence at start/end to ground Whisper
-        silence_padding = b'\x00' * (SAMPLE_RATE // 5 * 2) # 200ms * 2 bytes/sample
-        processed_audio = silence_padding + audio + silence_padding
-        
-        with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as f:
-            path = f.name
-            with wave.open(path, "wb") as w:
-                w.setnchannels(1)
-                w.setsampwidth(2)
-                w.setframerate(SAMPLE_RATE)
-                w.writeframes(processed_audio)
+        # Build the WAV in memory - no temp file round-trip per utterance
+        data_size = len(audio) + 2 * len(_SILENCE_200MS)
+        buf = io.BytesIO(b"".join((_wav_header(data_size), _SILENCE_200MS, audio, _SILENCE_200MS)))
 
         # Use OpenAI API for Whisper transcription
-        from openai import OpenAI
-        client = OpenAI(api_key=api_key)
-        with open(path, "rb") as audio_file:
-            res = client.audio.transcriptions.create(
-                model="whisper-1",
-                file=audio_file,
-                language="ar"
-            )
+        client = _get_openai(api_key)
+        res = client.audio.transcriptions.create(
+            model="whisper-1",
+            file=("audio.wav", buf, "audio/wav"),
+            language="ar"
+        )
         return res.text or ""
     except Exception as e:
         logger.error(f"OpenAI Whisper error: {e}")
         return ""
-    finally:
-        if path and os.path.exists(path):
-            try:
-                os.unlink(path)
-            except:
-                pass
 
 
-async def transcribe_audio(audio: bytearray) -> str:
+async def transcribe_audio(audio: bytes) -> str:
     if not settings.OPENAI_API_KEY or settings.DUMMY_MODE:
         logger.warning("Using dummy transcription - API key invalid or dummy mode enabled")
         import random
@@ -233,12 +300,10 @@ async def transcribe_audio(audio: bytearray) -> str:
         try:
             loop = asyncio.get_running_loop()
             return await loop.run_in_executor(
-                None,
-                functools.partial(
-                    _transcribe_sync,
-                    bytes(audio),
-                    settings.OPENAI_API_KEY
-                )
+                STT_POOL,
+                _transcribe_sync,
+                audio,
+                settings.OPENAI_API_KEY
             )
         except Exception as e:
             logger.error(f"Transcription error with OpenAI API: {e}")
@@ -247,18 +312,34 @@ async def transcribe_audio(audio: bytearray) -> str:
 
 
 # ================= WebSocket Outbound Queue =================
+SEND_QUEUE_MAXSIZE = 64       # Backpressure: producers wait if the client stalls
+COALESCE_MAX_BYTES = 32768    # Merge back-to-back PCM chunks up to ~32KB per frame
+
+
 async def websocket_sender(ws: WebSocket, queue: asyncio.Queue):
+    pending = None
     try:
         while True:
-            msg = await queue.get()
+            msg = pending if pending is not None else await queue.get()
+            pending = None
             
             # Use appropriate send method based on message type
             if isinstance(msg, bytes):
-                await ws.send_bytes(msg)
+                parts = [msg]
+                size = len(msg)
+                while size < COALESCE_MAX_BYTES and not queue.empty():
+                    nxt = queue.get_nowait()
+                    if not isinstance(nxt, bytes):
+                        pending = nxt  # Sent on the next iteration, order preserved
+                        break
+                    parts.append(nxt)
+                    size += len(nxt)
+                await ws.send_bytes(parts[0] if len(parts) == 1 else b"".join(parts))
+                for _ in parts:
+                    queue.task_done()
             else:
-                await ws.send_json(msg)
-                
-            queue.task_done()
+                await ws.send_text(orjson.dumps(msg).decode())
+                queue.task_done()
     except (WebSocketDisconnect, asyncio.CancelledError):
         logger.debug("Sender task cancelled")
     except Exception as e:
@@ -269,7 +350,7 @@ async def websocket_sender(ws: WebSocket, queue: asyncio.Queue):
 # ================= Core AI Pipeline =================
 async def process_audio_buffer(
     send_queue: asyncio.Queue,
-    audio: bytearray,
+    audio: bytes,
     context: Dict,
     state: SessionState,
     tenant_engine: GroqEngine
@@ -314,39 +395,40 @@ async def process_audio_buffer(
 
         # 3. Visual Feedback (User Text)
         await send_queue.put({"type": "user_text", "content": text})
-        logger.bind(request_id=request_id).info(f"User: {text}")
+        logger.bind(request_id=request_id).info("User: {}", text)
 
         # 4. Process Request via RAG Engine
         collected_text = ""
         first_audio = True
 
-        async for event in tenant_engine.process_request(text, context):
-            if event["type"] == "audio":
-                if first_audio:
-                    state.speaking = True
-                    await send_queue.put({"type": "audio_start"})
-                    first_audio = False
-                await send_queue.put(event["content"]) # Raw PCM_16000 bytes
-
-            elif event["type"] == "text":
-                collected_text += event["content"]
-                await send_queue.put({"type": "text", "content": event["content"]})
-
-        # 5. Context Persistence
-        if "history" not in context:
-            context["history"] = []
+        # aclosing: on cancellation the engine generator (and its open TTS
+        # response) is closed right away rather than left suspended
+        async with aclosing(tenant_engine.process_request(text, context)) as events:
+            async for event in events:
+                if event["type"] == "audio":
+                    if first_audio:
+                        state.speaking = True
+                        await send_queue.put({"type": "audio_start"})
+                        first_audio = False
+                    await send_queue.put(event["content"]) # Raw PCM_16000 bytes
+
+                elif event["type"] == "text":
+                    collected_text += event["content"]
+                    await send_queue.put({"type": "text", "content": event["content"]})
+
+        # 5. Context Persistence (history is a deque(maxlen=6) - rolling memory)
         context["history"].append({"role": "user", "content": text})
         context["history"].append({"role": "assistant", "content": collected_text})
-        context["history"] = context["history"][-6:] # Rolling memory
 
         # 6. Finalize Interaction
         await send_queue.put({"type": "audio_end"})
         
-        duration = (time.time() - start_time) * 1000
-        logger.bind(request_id=request_id).success(f"Interaction Complete: {duration:.2f}ms")
+        logger.bind(request_id=request_id).opt(lazy=True).success(
+            "Interaction Complete: {:.2f}ms", lambda: (time.time() - start_time) * 1000
+        )
 
     except Exception as e:
-        logger.bind(request_id=request_id).error(f"Pipeline Error: {e}")
+        logger.bind(request_id=request_id).error("Pipeline Error: {}", e)
         state.speaking = False
     finally:
         state.processing = False
@@ -383,18 +465,24 @@ async def websocket_endpoint(ws: WebSocket, tenant_id: str, user_id: str):
 
     logger.info(f"Connected {session_id}")
 
-    context = await memory_manager.get_user_context(tenant_id, user_id)
+    # Memory-only deployments skip the coroutine round-trip entirely
+    context = memory_manager.get_user_context_nowait(tenant_id, user_id)
+    if context is None:
+        context = await memory_manager.get_user_context(tenant_id, user_id)
     context.update({"tenant_id": tenant_id, "user_id": user_id})
 
-    send_queue = asyncio.Queue()
+    send_queue = asyncio.Queue(maxsize=SEND_QUEUE_MAXSIZE)
     sender_task = asyncio.create_task(websocket_sender(ws, send_queue))
+    # Pipelines block on the bounded queue once the sender is gone, so they
+    # are tracked and cancelled together with it
+    pipeline_tasks = set()
 
     state = SessionState()
 
     # Audio context is managed via 'playback_done' signal for VAD gating
 
     buffer = bytearray()
-    silence_start = None
+    silence_samples = 0
     is_speaking = False
 
     try:
@@ -412,31 +500,35 @@ async def websocket_endpoint(ws: WebSocket, tenant_id: str, user_id: str):
 
                 if rms > VOICE_THRESHOLD:
                     is_speaking = True
-                    silence_start = None
+                    silence_samples = 0
                     buffer.extend(chunk)
 
-                elif rms <= SILENCE_THRESHOLD and is_speaking:
-                    if silence_start is None:
-                        silence_start = time.time()
+                elif is_speaking and (rms <= SILENCE_THRESHOLD or silence_samples):
+                    # Silence is measured by audio received, not wall clock - no time syscalls
+                    silence_samples += len(chunk) >> 1
                         
-                    if time.time() - silence_start >= SILENCE_DURATION_LIMIT:
+                    if silence_samples >= SILENCE_SAMPLES_LIMIT:
                         if len(buffer) >= MIN_BUFFER_SIZE:
+                            # Single immutable snapshot; the worker owns it from here
+                            audio_to_send = bytes(buffer)
                             # معالجة الصوت في تاسك منفصلة لضمان استمرارية الاستقبال
-                            asyncio.create_task(process_audio_buffer(
+                            task = asyncio.create_task(process_audio_buffer(
                                 send_queue,
-                                buffer[:],
+                                audio_to_send,
                                 context,
                                 state,
                                 tenant_engine # Pass the dynamically loaded engine
                             ))
+                            pipeline_tasks.add(task)
+                            task.add_done_callback(pipeline_tasks.discard)
                         buffer.clear()
                         is_speaking = False
-                        silence_start = None
+                        silence_samples = 0
 
             # معالجة الرسائل النصية
             elif "text" in message:
                 try:
-                    data = json.loads(message["text"])
+                    data = orjson.loads(message["text"])
                     if data.get("type") == "playback_done":
                         logger.debug("Client finished playback, reopening mic")
                         state.speaking = False
@@ -444,7 +536,7 @@ async def websocket_endpoint(ws: WebSocket, tenant_id: str, user_id: str):
                     elif data.get("type") == "ping":
                         await send_queue.put({"type": "pong"})
                 except Exception as e:
-                    logger.warning(f"Failed to parse text message: {e}")
+                    logger.warning("Failed to parse text message: {}", e)
 
     except WebSocketDisconnect:
         logger.info(f"Client disconnected: {session_id}")
@@ -452,6 +544,8 @@ async def websocket_endpoint(ws: WebSocket, tenant_id: str, user_id: str):
         logger.error(f"WebSocket Loop Error for {session_id}: {e}")
     finally:
         sender_task.cancel()
+        for task in pipeline_tasks:
+            task.cancel()
         request_id_var.reset(token)
         logger.info(f"Finalized session {session_id}")
 
@@ -8,30 +8,99 @@ Features:
 - Async TTS streaming for non-blocking operation.
 """
 
-import asyncio
-import json
-import os
+import functools
 import sys
 import time
-from typing import AsyncGenerator, Dict, List
+from contextlib import aclosing
+from typing import AsyncGenerator, Dict, Optional
 from pathlib import Path
-import aiohttp
+import httpx
+import orjson
 from groq import AsyncGroq
 from loguru import logger
-from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
+from tenacity import AsyncRetrying, stop_after_attempt, wait_exponential, retry_if_exception_type
 
 # Add parent directory to path for config import
 PARENT_DIR = Path(__file__).parent.parent.resolve()
 if str(PARENT_DIR) not in sys.path:
     sys.path.insert(0, str(PARENT_DIR))
 
+DATA_DIR = PARENT_DIR / "data"
+
 from config import settings
 
+
+@functools.lru_cache(maxsize=4)
+def get_groq_client(api_key: str) -> AsyncGroq:
+    """Shared AsyncGroq client per key so sessions reuse one connection pool."""
+    return AsyncGroq(api_key=api_key)
+
+
+# Shared ElevenLabs HTTP/2 pool: keeps TLS warm across utterances and sessions
+_tts_client: Optional[httpx.AsyncClient] = None
+
+
+def get_tts_client() -> httpx.AsyncClient:
+    """Shared TTS client, created on first use and again after close_http_clients()."""
+    global _tts_client
+    if _tts_client is None:
+        _tts_client = httpx.AsyncClient(
+            http2=True,
+            timeout=httpx.Timeout(8.0, connect=2.0),
+            limits=httpx.Limits(max_keepalive_connections=32),
+        )
+    return _tts_client
+
+
+async def close_http_clients():
+    """Release pooled HTTP connections on application shutdown."""
+    global _tts_client
+    client, _tts_client = _tts_client, None
+    if client is not None:
+        await client.aclose()
+
+
+@functools.lru_cache(maxsize=64)
+def _read_tenant_db(db_path: str, mtime_ns: int) -> Dict:
+    """Parsed tenant DB, shared read-only across sessions. mtime_ns invalidates on edit."""
+    with open(db_path, "rb") as f:
+        return orjson.loads(f.read())
+
+
+def preload_tenant_dbs() -> int:
+    """Parse every tenant DB into the cache so the first session skips disk + JSON."""
+    loaded = 0
+    for db_path in DATA_DIR.glob("*_db.json"):
+        try:
+            _read_tenant_db(str(db_path), db_path.stat().st_mtime_ns)
+            loaded += 1
+        except Exception as e:
+            logger.warning(f"Failed to preload tenant DB {db_path.name}: {e}")
+    return loaded
+
+
+def _retry_open(exc_type) -> AsyncRetrying:
+    """
+    Retry policy for opening an upstream stream. Only the open is retried:
+    once chunks have been yielded downstream they can't be replayed.
+    """
+    return AsyncRetrying(
+        stop=stop_after_attempt(3),
+        wait=wait_exponential(multiplier=0.5, min=0.5, max=2),
+        retry=retry_if_exception_type(exc_type),
+        reraise=True
+    )
+
+
 class GroqEngine:
     """
     Senior AI Architect Implementation of Tiryaq Voice Engine.
     Strict Adherence to Najm AI Standards: Low Latency, No Hallucinations, Dynamic Context.
     """
+
+    # TTS is flushed per sentence, not per comma, to cut ElevenLabs round trips
+    _SENT_END = frozenset(".!؟\n")
+    _MIN_TTS_CHARS = 20
     
     def __init__(self, tenant_id: str):
         self.tenant_id = tenant_id
@@ -46,6 +115,10 @@ class GroqEngine:
         self.max_tokens = 150
         self.temperature = 0.5 # Lower temperature for better grounding
 
+        # Persona + KB are fixed for the session: build the prompt once
+        self._system_prompt = self._build_system_prompt()
+        self._system_message = {"role": "system", "content": self._system_prompt}
+
     def _load_tenant_db(self, tenant_id: str) -> Dict:
         """Loads the unique JSON database for the tenant."""
         try:
@@ -58,17 +131,15 @@ class GroqEngine:
             
             clean_id = id_map.get(tenant_id.lower().strip(), tenant_id)
             
-            base_dir = Path(__file__).parent.parent 
-            db_path = base_dir / "data" / f"{clean_id}_db.json"
+            db_path = DATA_DIR / f"{clean_id}_db.json"
             
             if not db_path.exists():
                 logger.warning(f"DB for {tenant_id} not found at {db_path}, using default.")
-                db_path = base_dir / "data" / "tiryaq_db.json" 
+                db_path = DATA_DIR / "tiryaq_db.json"
             
-            with open(db_path, "r", encoding="utf-8") as f:
-                data = json.load(f)
-                logger.success(f"Loaded knowledge base from {db_path} for: {data.get('tenant_name')}")
-                return data
+            data = _read_tenant_db(str(db_path), db_path.stat().st_mtime_ns)
+            logger.success(f"Loaded knowledge base from {db_path} for: {data.get('tenant_name')}")
+            return data
         except Exception as e:
             logger.error(f"Critical Error: Failed to load tenant database: {e}")
             return {"knowledge_base": {}, "persona": {}}
@@ -79,7 +150,7 @@ class GroqEngine:
             logger.warning("GROQ_API_KEY not set - using fallback mode")
             return None
         try:
-            return AsyncGroq(api_key=api_key)
+            return get_groq_client(api_key)
         except Exception as e:
             logger.error(f"Failed to initialize Groq client: {e}")
             return None
@@ -89,7 +160,7 @@ class GroqEngine:
         Premium Saudi AI Consultant Prompt.
         Focus: Natural White Dialect, Extreme Contextual Awareness, Zero Hallucinations.
         """
-        kb_content = json.dumps(self.db.get("knowledge_base", {}), ensure_ascii=False)
+        kb_content = orjson.dumps(self.db.get("knowledge_base", {})).decode()
         persona_rules = "\n".join(self.db.get("persona", {}).get("rules", []))
         
         prompt = f"""
@@ -119,12 +190,6 @@ Arabic (Saudi White Dialect) ONLY. No English words.
 """
         return prompt.strip()
 
-    @retry(
-        stop=stop_after_attempt(3),
-        wait=wait_exponential(multiplier=0.5, min=0.5, max=2),
-        retry=retry_if_exception_type(Exception),
-        reraise=True
-    )
     async def process_request(self, user_text: str, context: Dict) -> AsyncGenerator[Dict, None]:
         start_time = time.time()
         ttfb_recorded = False
@@ -136,26 +201,26 @@ Arabic (Saudi White Dialect) ONLY. No English words.
             yield {"type": "text", "content": "أهلاً وسهلاً! الخدمة حالياً في وضع تجريبي. لحظة وأكون معك."}
             return
         
-        system_prompt = self._build_system_prompt()
-        messages = [{"role": "system", "content": system_prompt}]
+        messages = [self._system_message]
         
         if "history" in context:
-            messages.extend(context["history"][-4:])
+            messages.extend(list(context["history"])[-4:])
         messages.append({"role": "user", "content": user_text})
         
         try:
-            stream = await self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                max_tokens=self.max_tokens,
-                temperature=0.7, # Slightly higher for more natural flow
-                stream=True
-            )
+            async for attempt in _retry_open(Exception):
+                with attempt:
+                    stream = await self.client.chat.completions.create(
+                        model=self.model,
+                        messages=messages,
+                        max_tokens=self.max_tokens,
+                        temperature=0.7, # Slightly higher for more natural flow
+                        stream=True
+                    )
             
             async for chunk in stream:
                 if not ttfb_recorded:
-                    ttfb = (time.time() - start_time) * 1000
-                    logger.debug(f"TTFT: {ttfb:.2f}ms")
+                    logger.opt(lazy=True).debug("TTFT: {:.2f}ms", lambda: (time.time() - start_time) * 1000)
                     ttfb_recorded = True
 
                 content = chunk.choices[0].delta.content
@@ -163,21 +228,23 @@ Arabic (Saudi White Dialect) ONLY. No English words.
                     text_buffer += content
                     yield {"type": "text", "content": content}
                     
-                    if any(punct in content for punct in [".", "!", "؟", "\n", "،"]):
-                        async for audio in self._tts_stream(text_buffer):
-                            yield {"type": "audio", "content": audio}
+                    if len(text_buffer) >= self._MIN_TTS_CHARS and text_buffer[-1] in self._SENT_END:
+                        async with aclosing(self._tts_stream(text_buffer)) as audio_chunks:
+                            async for audio in audio_chunks:
+                                yield {"type": "audio", "content": audio}
                         text_buffer = ""
             
             if text_buffer.strip():
-                async for audio in self._tts_stream(text_buffer):
-                    yield {"type": "audio", "content": audio}
+                async with aclosing(self._tts_stream(text_buffer)) as audio_chunks:
+                    async for audio in audio_chunks:
+                        yield {"type": "audio", "content": audio}
 
         except Exception as e:
             logger.error(f"Engine Processing Error: {e}")
             yield {"type": "error", "content": "حدث خطأ، لحظة وأكون معك."}
 
     async def _tts_stream(self, text: str) -> AsyncGenerator[bytes, None]:
-        """Async TTS streaming using aiohttp for non-blocking operation."""
+        """Async TTS streaming over the shared httpx HTTP/2 client."""
         if not self.elevenlabs_api_key or not text.strip():
             logger.warning("Skipping TTS: No API key or empty text")
             return
@@ -185,7 +252,7 @@ Arabic (Saudi White Dialect) ONLY. No English words.
         # Use a fallback voice if needed
         voice_id = self.voice_id
         if not voice_id or voice_id == "EXAVITQu4vr4xnSDxMaL":
-            logger.warning(f"Invalid voice ID {voice_id}, using fallback voice")
+            logger.warning("Invalid voice ID {}, using fallback voice", voice_id)
             voice_id = "pNInz6obpgDQGcFmaJgB"  # Known working Arabic voice
 
         url = f"https://api.elevenlabs.io/v1/text-to-speech/{voice_id}/stream"
@@ -205,26 +272,32 @@ Arabic (Saudi White Dialect) ONLY. No English words.
             "voice_settings": {"stability": 0.5, "similarity_boost": 0.75}
         }
         
-        timeout = aiohttp.ClientTimeout(total=10, connect=5)
+        client = get_tts_client()
+        request = client.build_request(
+            "POST",
+            url,
+            json=data,
+            headers=headers,
+            params=params
+        )
         
         try:
-            async with aiohttp.ClientSession(timeout=timeout) as session:
-                async with session.post(
-                    url, 
-                    json=data, 
-                    headers=headers, 
-                    params=params
-                ) as response:
-                    if response.status == 200:
-                        async for chunk in response.content.iter_chunked(16384):
-                            if chunk:
-                                yield chunk
-                    else:
-                        error_text = await response.text()
-                        logger.error(f"TTS Error [{response.status}]: {error_text}")
-        except asyncio.TimeoutError:
+            async for attempt in _retry_open(httpx.TransportError):
+                with attempt:
+                    response = await client.send(request, stream=True)
+            try:
+                if response.status_code == 200:
+                    async for chunk in response.aiter_bytes(16384):
+                        if chunk:
+                            yield chunk
+                else:
+                    error_text = (await response.aread()).decode("utf-8", errors="replace")
+                    logger.error("TTS Error [{}]: {}", response.status_code, error_text)
+            finally:
+                await response.aclose()
+        except httpx.TimeoutException:
             logger.error("TTS Timeout - ElevenLabs API took too long")
-        except aiohttp.ClientError as e:
+        except httpx.HTTPError as e:
             logger.error(f"TTS Connection Failed: {e}")
         except Exception as e:
-            logger.error(f"TTS Unexpected Error: {e}")
\ No newline at end of file
+            logger.error(f"TTS Unexpected Error: {e}")
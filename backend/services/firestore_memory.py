@@ -4,17 +4,133 @@ Najm AI Standard: Robust Firebase/Firestore with In-Memory Fallback
 Handles gRPC/libstdc++ failures gracefully in restricted environments.
 """
 
+import asyncio
+import functools
 import os
-import sys
-from typing import Dict, Any, Optional
-from pathlib import Path
-from datetime import datetime
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Tuple
+from types import MappingProxyType
+import orjson
+from dotenv import load_dotenv
 from loguru import logger
 
-# Add parent directory to path for config import
-PARENT_DIR = Path(__file__).parent.parent.resolve()
-if str(PARENT_DIR) not in sys.path:
-    sys.path.insert(0, str(PARENT_DIR))
+# Backend root, computed with string ops only (no resolve() stat calls)
+PARENT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Cache key: a (tenant_id, user_id) tuple. Unlike "tenant_user" strings it
+# can't collide across tenant boundaries (e.g. "a"/"b_c" vs "a_b"/"c").
+UserKey = Tuple[str, str]
+
+# Rolling conversation memory (user + assistant messages)
+HISTORY_MAXLEN = 6
+
+# Read-only base user context; created_at and history are filled per copy
+_DEFAULT_CONTEXT = MappingProxyType({
+    "first_name": "ضيف",
+    "long_term_memory": "",
+})
+
+# Write coalescing: Firestore batches cap at 500 ops / 10 MiB, keep headroom
+WRITE_FLUSH_INTERVAL = 0.02
+WRITE_BATCH_MAX_OPS = 450
+WRITE_BATCH_MAX_BYTES = 9 * 1024 * 1024
+
+# Blocking gRPC calls run here instead of on the event loop
+FIRESTORE_MAX_WORKERS = 40
+
+# Voice turns can't wait out gRPC's default deadline: fail fast, and after
+# repeated failures skip Firestore entirely for a cool-down period
+FIRESTORE_RPC_TIMEOUT = 2.0
+CIRCUIT_FAILURE_THRESHOLD = 5
+CIRCUIT_OPEN_SECONDS = 30
+
+# In-memory fallback cache bounds
+MEMORY_CACHE_MAX_ENTRIES = 10_000
+MEMORY_CACHE_TTL_SECONDS = 600
+MEMORY_CACHE_SHARDS = 16  # Power of two: shard = hash(key) & (SHARDS - 1)
+
+# Imported once at module load. Import-time failures (missing packages, gRPC /
+# libstdc++ errors) are kept and reported when the manager initializes.
+try:
+    import firebase_admin
+    from firebase_admin import credentials, firestore
+    from google.cloud.firestore import AsyncClient
+    _FIREBASE_IMPORT_ERROR: Optional[Exception] = None
+except Exception as e:
+    firebase_admin = credentials = firestore = AsyncClient = None
+    _FIREBASE_IMPORT_ERROR = e
+
+
+@functools.lru_cache(maxsize=1)
+def _find_credentials() -> Optional[str]:
+    """
+    Resolve the Firebase credentials file once, on first manager init.
+    GOOGLE_APPLICATION_CREDENTIALS is tried first (relative paths are taken
+    from the backend dir, as in .env); otherwise the common locations.
+    """
+    # This module may be imported before config, so make sure .env is applied
+    load_dotenv(os.path.join(PARENT_DIR, ".env"))
+    
+    pinned = os.getenv("GOOGLE_APPLICATION_CREDENTIALS", "")
+    if pinned:
+        if not os.path.isabs(pinned):
+            pinned = os.path.normpath(os.path.join(PARENT_DIR, pinned))
+        if os.path.isfile(pinned):
+            return pinned
+        logger.warning(f"GOOGLE_APPLICATION_CREDENTIALS file not found: {pinned}")
+    
+    search_paths = (
+        # Deployment paths
+        "/app/serviceAccountKey.json",
+        "/app/backend/serviceAccountKey.json",
+        # Local development paths
+        os.path.join(PARENT_DIR, "serviceAccountKey.json"),
+        os.path.join(os.path.dirname(PARENT_DIR), "serviceAccountKey.json"),
+    )
+    return next((path for path in search_paths if os.path.isfile(path)), None)
+
+
+class _TTLCache:
+    """
+    Size-capped LRU with per-entry TTL. Keys are spread over lock-sharded
+    OrderedDicts so executor threads and the event loop rarely contend.
+    """
+    
+    def __init__(self, max_entries: int, ttl: float, shards: int):
+        self._ttl = ttl
+        self._mask = shards - 1
+        self._shard_max = max(1, max_entries // shards)
+        self._shards = [OrderedDict() for _ in range(shards)]
+        self._locks = [threading.Lock() for _ in range(shards)]
+    
+    def get(self, key, default=None):
+        idx = hash(key) & self._mask
+        shard = self._shards[idx]
+        with self._locks[idx]:
+            entry = shard.get(key)
+            if entry is None:
+                return default
+            stamp, value = entry
+            if time.monotonic() - stamp >= self._ttl:
+                del shard[key]
+                return default
+            shard.move_to_end(key)
+            return value
+    
+    def __setitem__(self, key, value):
+        idx = hash(key) & self._mask
+        shard = self._shards[idx]
+        with self._locks[idx]:
+            shard[key] = (time.monotonic(), value)
+            shard.move_to_end(key)
+            if len(shard) > self._shard_max:
+                shard.popitem(last=False)
+    
+    def __len__(self) -> int:
+        return sum(len(shard) for shard in self._shards)
 
 
 class MemoryManager:
@@ -27,18 +143,55 @@ class MemoryManager:
     """
     
     # Class-level in-memory storage for fallback across instances
-    _memory_cache: Dict[str, Dict] = {}
+    _memory_cache = _TTLCache(
+        MEMORY_CACHE_MAX_ENTRIES,
+        MEMORY_CACHE_TTL_SECONDS,
+        MEMORY_CACHE_SHARDS
+    )
+    
+    # Process-wide singleton: Firebase init and credential lookup happen once
+    _instance: Optional["MemoryManager"] = None
+    
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance._initialized = False
+        return cls._instance
     
     def __init__(self):
+        if self._initialized:
+            return
         self.db: Optional[Any] = None
+        self.async_db: Optional[Any] = None
         self._firebase_available = False
+        self._tenant_doc = None
+        self._pending_writes: Dict[UserKey, Tuple[Any, Dict]] = {}
+        self._pending_bytes = 0
+        self._write_lock = asyncio.Lock()
+        self._flush_task: Optional[asyncio.Task] = None
+        self._consec_failures = 0
+        self._circuit_open_until = 0.0
+        self._executor = ThreadPoolExecutor(
+            max_workers=FIRESTORE_MAX_WORKERS,
+            thread_name_prefix="firestore"
+        )
         self._init_firestore()
+        if self.db is not None:
+            self.async_db = self._build_async_client()
+            # Bind the top-level collection once; _user_ref chains from here.
+            # Refs come from the async client when available, so all voice-turn
+            # I/O is awaited natively rather than trampolined through threads.
+            client = self.async_db if self.async_db is not None else self.db
+            self._tenant_doc = client.collection("tenants").document
+        # DocumentReferences are immutable - build each (tenant, user) ref once
+        self._user_ref = functools.lru_cache(maxsize=MEMORY_CACHE_MAX_ENTRIES)(self._build_user_ref)
+        self._initialized = True
     
     def _init_firestore(self):
         """Initialize Firebase with comprehensive error handling."""
         try:
-            import firebase_admin
-            from firebase_admin import credentials, firestore
+            if _FIREBASE_IMPORT_ERROR is not None:
+                raise _FIREBASE_IMPORT_ERROR
             
             # Check if already initialized
             if firebase_admin._apps:
@@ -47,8 +200,7 @@ class MemoryManager:
                 logger.info("Using existing Firebase app instance")
                 return
             
-            # Search for credentials file
-            cred_path = self._find_credentials()
+            cred_path = _find_credentials()
             
             if cred_path:
                 cred = credentials.Certificate(cred_path)
@@ -75,99 +227,243 @@ class MemoryManager:
             self.db = None
             self._firebase_available = False
     
-    def _find_credentials(self) -> Optional[str]:
-        """Search for Firebase credentials in common locations."""
-        search_paths = [
-            # Deployment paths
-            "/app/serviceAccountKey.json",
-            "/app/backend/serviceAccountKey.json",
-            # Local development paths
-            str(PARENT_DIR / "serviceAccountKey.json"),
-            str(PARENT_DIR.parent / "serviceAccountKey.json"),
-            # Environment variable path
-            os.getenv("GOOGLE_APPLICATION_CREDENTIALS", ""),
-        ]
-        
-        for path in search_paths:
-            if path and Path(path).exists():
-                return path
-        
-        return None
+    def _build_async_client(self) -> Optional[Any]:
+        """Native asyncio Firestore client sharing the Firebase app's credentials."""
+        try:
+            app = firebase_admin.get_app()
+            return AsyncClient(
+                project=app.project_id,
+                credentials=app.credential.get_credential()
+            )
+        except Exception as e:
+            logger.warning(f"Firestore AsyncClient unavailable, using threaded sync client: {e}")
+            return None
+    
+    async def _run_blocking(self, fn, *args, **kwargs):
+        """Run a synchronous Firestore call on the dedicated pool."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(fn, *args, **kwargs))
+    
+    def _firestore_usable(self) -> bool:
+        """Firestore is configured and the circuit breaker is closed."""
+        return (
+            self._firebase_available
+            and self.db is not None
+            and time.monotonic() >= self._circuit_open_until
+        )
+    
+    def _record_success(self):
+        # Only a success closes the circuit
+        self._consec_failures = 0
+    
+    def _record_failure(self):
+        # The count is kept when the circuit opens, so the first call after the
+        # cool-down is a half-open trial: one more failure reopens it at once
+        self._consec_failures += 1
+        if self._consec_failures >= CIRCUIT_FAILURE_THRESHOLD:
+            self._circuit_open_until = time.monotonic() + CIRCUIT_OPEN_SECONDS
+            logger.warning(f"Firestore circuit open for {CIRCUIT_OPEN_SECONDS}s - using in-memory fallback")
     
-    def _get_cache_key(self, tenant_id: str, user_id: str) -> str:
-        """Generate consistent cache key."""
-        return f"{tenant_id}_{user_id}"
+    async def _get_doc(self, ref):
+        if self.async_db is not None:
+            return await ref.get(timeout=FIRESTORE_RPC_TIMEOUT)
+        return await self._run_blocking(ref.get, timeout=FIRESTORE_RPC_TIMEOUT)
+    
+    async def _get_docs(self, refs: List[Any]) -> List[Any]:
+        if self.async_db is not None:
+            return [doc async for doc in self.async_db.get_all(refs, timeout=FIRESTORE_RPC_TIMEOUT)]
+        return await self._run_blocking(lambda: list(self.db.get_all(refs, timeout=FIRESTORE_RPC_TIMEOUT)))
+    
+    async def _set_doc(self, ref, data: Dict, merge: bool = False):
+        if self.async_db is not None:
+            await ref.set(data, merge=merge, timeout=FIRESTORE_RPC_TIMEOUT)
+        else:
+            await self._run_blocking(ref.set, data, merge=merge, timeout=FIRESTORE_RPC_TIMEOUT)
+    
+    def _build_user_ref(self, tenant_id: str, user_id: str):
+        """Firestore document for a tenant's user."""
+        return self._tenant_doc(tenant_id).collection("users").document(user_id)
+    
+    def get_user_context_nowait(self, tenant_id: str, user_id: str) -> Optional[Dict]:
+        """
+        Synchronous fast path for the in-memory fallback. Returns the context
+        when Firestore is not in use, or None when the caller must await
+        get_user_context() for real I/O.
+        """
+        if self._firestore_usable():
+            return None
+        return self._cached_context((tenant_id, user_id))
     
     async def get_user_context(self, tenant_id: str, user_id: str) -> Dict:
         """
         Retrieve user context with automatic fallback.
         Always returns a valid dict - never raises.
         """
-        cache_key = self._get_cache_key(tenant_id, user_id)
+        cache_key: UserKey = (tenant_id, user_id)
         
         # Return from in-memory cache if Firebase unavailable
-        if not self._firebase_available or not self.db:
-            return self._memory_cache.get(cache_key, self._create_default_context())
+        if not self._firestore_usable():
+            return self._cached_context(cache_key)
         
         try:
-            user_ref = self.db.collection("tenants").document(tenant_id).collection("users").document(user_id)
-            doc = user_ref.get()
+            user_ref = self._user_ref(tenant_id, user_id)
+            doc = await self._get_doc(user_ref)
+            self._record_success()
             
             if doc.exists:
                 data = doc.to_dict() or {}
                 # Cache for fallback
                 self._memory_cache[cache_key] = data
-                return data
+                return self._with_history_window(data)
             else:
                 return self._create_default_context()
                 
         except Exception as e:
+            self._record_failure()
             logger.error(f"Firestore read error: {e}")
             # Return cached data or default
-            return self._memory_cache.get(cache_key, self._create_default_context())
+            return self._cached_context(cache_key)
+    
+    async def get_user_contexts(self, pairs: List[UserKey]) -> List[Dict]:
+        """
+        Batched get_user_context: one get_all() RPC for many (tenant, user) pairs.
+        Results follow the order of `pairs`. Never raises.
+        """
+        keys = [(t, u) for t, u in pairs]
+        
+        if not self._firestore_usable():
+            return [self._cached_context(k) for k in keys]
+        
+        try:
+            refs = [self._user_ref(t, u) for t, u in pairs]
+            docs = {doc.reference.path: doc for doc in await self._get_docs(refs)}
+            self._record_success()
+            
+            results = []
+            for key, ref in zip(keys, refs):
+                doc = docs.get(ref.path)
+                if doc is not None and doc.exists:
+                    data = doc.to_dict() or {}
+                    self._memory_cache[key] = data
+                    results.append(self._with_history_window(data))
+                else:
+                    results.append(self._create_default_context())
+            return results
+            
+        except Exception as e:
+            self._record_failure()
+            logger.error(f"Firestore batch read error: {e}")
+            return [self._cached_context(k) for k in keys]
+    
+    def _cached_context(self, cache_key: UserKey) -> Dict:
+        """Cached context, or a fresh default only on a miss."""
+        context = self._memory_cache.get(cache_key)
+        if context is None:
+            return self._create_default_context()
+        return self._with_history_window(context)
+    
+    def _with_history_window(self, context: Dict) -> Dict:
+        """Ensure history is a bounded deque so appends evict in O(1)."""
+        history = context.get("history")
+        if not isinstance(history, deque) or history.maxlen != HISTORY_MAXLEN:
+            context["history"] = deque(history or [], maxlen=HISTORY_MAXLEN)
+        return context
     
     def _create_default_context(self) -> Dict:
         """Create default user context."""
-        return {
-            "first_name": "ضيف",
-            "long_term_memory": "",
-            "history": [],
-            "created_at": datetime.utcnow().isoformat()
-        }
+        return dict(
+            _DEFAULT_CONTEXT,
+            history=deque(maxlen=HISTORY_MAXLEN),
+            created_at=int(time.time())  # Epoch seconds
+        )
     
     async def save_summary(self, tenant_id: str, user_id: str, summary: str):
         """Save conversation summary to persistent storage."""
-        cache_key = self._get_cache_key(tenant_id, user_id)
+        cache_key: UserKey = (tenant_id, user_id)
         
-        # Always update in-memory cache
-        if cache_key in self._memory_cache:
-            self._memory_cache[cache_key]["long_term_memory"] = summary
-        else:
-            self._memory_cache[cache_key] = self._create_default_context()
-            self._memory_cache[cache_key]["long_term_memory"] = summary
+        # Always update in-memory cache (re-stored to refresh its TTL)
+        context = self._memory_cache.get(cache_key)
+        if context is None:
+            context = self._create_default_context()
+        context["long_term_memory"] = summary
+        self._memory_cache[cache_key] = context
         
         # Skip Firestore if unavailable
-        if not self._firebase_available or not self.db:
+        if not self._firestore_usable():
+            return
+        
+        await self._queue_write(cache_key, self._user_ref(tenant_id, user_id), {
+            "long_term_memory": summary,
+            "last_interaction": firestore.SERVER_TIMESTAMP
+        })
+    
+    async def _queue_write(self, cache_key: UserKey, ref: Any, data: Dict):
+        """Coalesce merge-writes per user; flushed together within WRITE_FLUSH_INTERVAL."""
+        async with self._write_lock:
+            if cache_key in self._pending_writes:
+                self._pending_writes[cache_key][1].update(data)
+            else:
+                self._pending_writes[cache_key] = (ref, dict(data))
+            self._pending_bytes += len(orjson.dumps(data, default=str))
+            full = (
+                len(self._pending_writes) >= WRITE_BATCH_MAX_OPS
+                or self._pending_bytes >= WRITE_BATCH_MAX_BYTES
+            )
+        
+        if full:
+            await self.flush()
+        elif self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_later())
+    
+    async def _flush_later(self):
+        # Writes queued while a commit is in flight see this task still running
+        # and don't schedule their own, so keep flushing until nothing is left
+        while True:
+            await asyncio.sleep(WRITE_FLUSH_INTERVAL)
+            await self.flush()
+            if not self._pending_writes:
+                return
+    
+    async def flush(self):
+        """Send all pending writes to Firestore in one batch."""
+        async with self._write_lock:
+            pending, self._pending_writes = self._pending_writes, {}
+            self._pending_bytes = 0
+        
+        if not pending or not self.db:
             return
         
+        def _write_batch():
+            bulk_writer = self.db.bulk_writer()
+            for ref, data in pending.values():
+                bulk_writer.set(ref, data, merge=True)
+            bulk_writer.close()  # Flushes, then blocks until all writes settle
+        
         try:
-            user_ref = self.db.collection("tenants").document(tenant_id).collection("users").document(user_id)
-            user_ref.set({
-                "long_term_memory": summary,
-                "last_interaction": datetime.utcnow()
-            }, merge=True)
+            if self.async_db is not None:
+                batch = self.async_db.batch()  # pending stays under the 500-op limit
+                for ref, data in pending.values():
+                    batch.set(ref, data, merge=True)
+                await batch.commit(timeout=FIRESTORE_RPC_TIMEOUT)
+            else:
+                await self._run_blocking(_write_batch)
+            self._record_success()
         except Exception as e:
+            self._record_failure()
             logger.error(f"Firestore save error: {e}")
     
     async def log_session(self, session_id: str, data: dict):
         """Log session data for analytics."""
-        if not self._firebase_available or not self.db:
+        if not self._firestore_usable():
             logger.debug(f"Session log (memory-only): {session_id}")
             return
             
         try:
-            self.db.collection("sessions").document(session_id).set(data)
+            client = self.async_db if self.async_db is not None else self.db
+            await self._set_doc(client.collection("sessions").document(session_id), data)
+            self._record_success()
         except Exception as e:
+            self._record_failure()
             logger.error(f"Firestore session log error: {e}")
     
     def get_status(self) -> Dict:
@@ -0,0 +1,51 @@
+"""
+Tiryaq Voice AI - RMS Kernel
+Najm AI Standard: Per-frame energy for VAD without Python-level sample loops.
+Uses a Numba JIT kernel when available, NumPy otherwise.
+"""
+
+import math
+
+import numpy as np
+from loguru import logger
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+
+def _sum_squares_numpy(samples) -> int:
+    return int(np.multiply(samples, samples, dtype=np.int64).sum())
+
+
+if njit is not None:
+    @njit(cache=True, fastmath=True)
+    def _sum_squares_i16(samples) -> int:
+        # int64 accumulator lets LLVM vectorize into int16 multiply-add
+        acc = 0
+        for i in range(samples.shape[0]):
+            s = np.int64(samples[i])
+            acc += s * s
+        return acc
+else:
+    _sum_squares_i16 = _sum_squares_numpy
+
+
+def rms_i16(chunk: bytes) -> int:
+    """RMS of little-endian PCM16 bytes. A trailing odd byte is ignored."""
+    samples = np.frombuffer(chunk[:len(chunk) & ~1], dtype="<i2")
+    if samples.size == 0:
+        return 0
+    return int(math.sqrt(_sum_squares_i16(samples) / samples.size))
+
+
+def warmup():
+    """Compile the JIT kernel up front so the first audio frame doesn't pay for it."""
+    global _sum_squares_i16
+    try:
+        rms_i16(b"\x00\x00")
+        logger.info(f"RMS kernel ready ({'numba' if _sum_squares_i16 is not _sum_squares_numpy else 'numpy'})")
+    except Exception as e:
+        logger.warning(f"RMS JIT warmup failed, using NumPy path: {e}")
+        _sum_squares_i16 = _sum_squares_numpy
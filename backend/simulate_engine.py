@@ -1,26 +1,37 @@
 
 import asyncio
+import functools
+import re
 import sys
-from typing import AsyncGenerator
+from typing import AsyncGenerator, ClassVar
+
+import numpy as np
 
 # Mocking the Gemini class as per 'backend/services/agent_engine.py' logic
 # with enhanced simulation capabilities for this dry run.
 
+# Lines of the system prompt that carry a verified rule (same match as a
+# per-line substring check, but one scan with no split() list)
+_RULE_RE = re.compile(r"^.*(?:ROLE|DIALECT|LATENCY).*$", re.M)
+
+# Symptom/booking intent: one pass over the prompt for any keyword
+_INTENT_KEYWORDS = ("تعبان", "موعد")
+_INTENT_RE = re.compile("|".join(map(re.escape, _INTENT_KEYWORDS)))
+
 class GeminiMock:
     def __init__(self, system_prompt):
         self.system_prompt = system_prompt
         # VERIFICATION POINT 1: Check if System Prompt enforces Identity & Dialect
         print("\n[VERIFICATION] Loaded System Prompt Rules:")
-        for line in system_prompt.split('\n'):
-            if "ROLE" in line or "DIALECT" in line or "LATENCY" in line:
-                print(f"  {line.strip()}")
+        for m in _RULE_RE.finditer(system_prompt):
+            print(f"  {m.group(0).strip()}")
     
     async def generate_content_stream(self, prompt):
         print(f"\n[VERIFICATION] Input received by LLM Brain: '{prompt}'")
         
         # VERIFICATION POINT 2: Simulate Smart Response based on "Saudi Dialect" rule
         # Since this is a Mock, we return hardcoded strings for this specific query
-        if "تعبان" in prompt or "موعد" in prompt:
+        if _INTENT_RE.search(prompt):
             response_parts = ["سلامتك ", "يا غالي ", "ما تشوف شر. ", "تبي ", "أحجز لك ", "عند طبيب عام؟"]
         else:
             response_parts = ["أبشر، ", "طلبك ", "جاهز ", "طال عمرك."]
@@ -30,13 +41,14 @@ class GeminiMock:
             yield part
             await asyncio.sleep(0.1) # Simulate network packet delay
 
-class TiryaqEngine:
-    def __init__(self):
-        self.system_prompt = self._load_system_prompt()
-        self.llm = GeminiMock(self.system_prompt)
+@functools.lru_cache(maxsize=4)
+def _get_llm(system_prompt: str) -> GeminiMock:
+    # One client per prompt, shared across engine instances (sessions)
+    return GeminiMock(system_prompt)
 
-    def _load_system_prompt(self) -> str:
-        return """
+class TiryaqEngine:
+    # Shared by every engine instance - built once at class definition
+    _SYSTEM_PROMPT: ClassVar[str] = """
         # ROLE
         You are "Tiryaq", an elite AI Voice Assistant representing Tiryaq Company in Saudi Arabia.
         
@@ -47,22 +59,46 @@ class TiryaqEngine:
         Keep responses under 20 words.
         """
 
+    def __init__(self):
+        self.system_prompt = self._SYSTEM_PROMPT
+        self.llm = _get_llm(self.system_prompt)
+        self._silence_thresh = 500  # Same RMS level as main.VOICE_THRESHOLD
+
     async def process_audio_stream(self, audio_chunks: AsyncGenerator[bytes, None], context: dict):
-        full_audio = b""
+        full_audio = bytearray()
         async for chunk in audio_chunks:
             if self.detect_silence(chunk):
                 break
-            full_audio += chunk
+            full_audio.extend(chunk)
         
         # SIMULATION STUB: Injecting the specific user request for verification
-        user_text = await self._stt_stub(full_audio) 
+        user_text = await self._stt_stub(bytes(full_audio)) 
         
-        async for response_chunk in self.llm.generate_content_stream(user_text):
-            yield response_chunk
+        queue = asyncio.Queue(maxsize=8)
+        producer = asyncio.create_task(self._pump(self.llm.generate_content_stream(user_text), queue))
+        try:
+            while (response_chunk := await queue.get()) is not None:
+                yield response_chunk
+            await producer  # Surface producer errors
+        finally:
+            producer.cancel()
+
+    async def _pump(self, stream, queue: asyncio.Queue):
+        # Producer: drain the LLM stream so the consumer (TTS) can overlap decode
+        try:
+            async for part in stream:
+                await queue.put(part)
+        except Exception:
+            await queue.put(None)
+            raise
+        await queue.put(None)
 
     def detect_silence(self, chunk: bytes) -> bool:
-        # Mock VAD Logic
-        return len(chunk) < 10
+        # Energy VAD: int16 RMS below threshold (trailing odd byte ignored)
+        samples = np.frombuffer(chunk[:len(chunk) & ~1], dtype=np.int16)
+        if samples.size == 0:
+            return True
+        return np.sqrt(np.mean(samples.astype(np.int32) ** 2)) < self._silence_thresh
 
     async def _stt_stub(self, audio_data: bytes) -> str:
         # Override to simulate specific input request
@@ -72,7 +108,7 @@ async def mock_audio_generator():
     # Simulate receiving Audio Bytes from WebSocket
     yield b"CHUNK_1_AUDIO_DATA"
     yield b"CHUNK_2_AUDIO_DATA"
-    yield b"SILENCE" # Trigger silence detection (less than 10 bytes)
+    yield bytes(640) # 20ms of PCM16 silence - triggers the RMS VAD
 
 async def main():
     print("--- STARTING TIRYAQ ENGINE SIMULATION ---")
@@ -2,41 +2,55 @@
 import asyncio
 import os
 import sys
+import types
 from dotenv import load_dotenv
 
-sys.stdout.reconfigure(encoding='utf-8')
-load_dotenv(dotenv_path="backend/.env")
-
 # Mock Settings 
 class MockSettings:
-    GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-    ELEVENLABS_API_KEY = os.getenv("ELEVENLABS_API_KEY")
-    DEFAULT_PERSONA_PATH = "personas/tiryaq.json"
-    LOG_LEVEL = "DEBUG"
+    def __init__(self):
+        # Read at construction so values come from the .env loaded in _bootstrap
+        self.GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+        self.ELEVENLABS_API_KEY = os.getenv("ELEVENLABS_API_KEY")
+        self.DEFAULT_PERSONA_PATH = "personas/tiryaq.json"
+        self.LOG_LEVEL = "DEBUG"
 
-import builtins
-import types
-config_mock = types.ModuleType("config")
-config_mock.settings = MockSettings()
-sys.modules["config"] = config_mock
+def _fake_requests_module() -> types.ModuleType:
+    """Minimal no-op stand-in for `requests` so no real HTTP calls are made."""
+    fake = types.ModuleType("requests")
+    fake.post = fake.get = lambda *args, **kwargs: types.SimpleNamespace(
+        status_code=200, content=b"", json=lambda: {}
+    )
+    return fake
+
+def _bootstrap() -> MockSettings:
+    """Script-only side effects, kept out of import time."""
+    sys.stdout.reconfigure(encoding='utf-8')
+    load_dotenv(dotenv_path="backend/.env")
 
-# Mock Requests for ElevnLabs
-from unittest.mock import MagicMock
-sys.modules["requests"] = MagicMock()
+    settings = MockSettings()
+    config_mock = types.ModuleType("config")
+    config_mock.settings = settings
+    sys.modules["config"] = config_mock
 
-sys.path.append(os.path.join(os.getcwd(), 'backend'))
+    # Mock Requests for ElevnLabs
+    sys.modules["requests"] = _fake_requests_module()
 
-try:
-    from services.agent_engine import GroqEngine
-    print("[SIMULATION] Imported GroqEngine")
-except ImportError as e:
-    print(f"[FAIL] Import Error: {e}")
-    sys.exit(1)
+    sys.path.append(os.path.join(os.getcwd(), 'backend'))
+    return settings
 
 async def main():
+    settings = _bootstrap()
+
+    try:
+        from services.agent_engine import GroqEngine
+        print("[SIMULATION] Imported GroqEngine")
+    except ImportError as e:
+        print(f"[FAIL] Import Error: {e}")
+        sys.exit(1)
+
     print("--- STARTING GROQ PLAN B VERIFICATION ---")
     
-    if not MockSettings.GROQ_API_KEY:
+    if not settings.GROQ_API_KEY:
         print("[FAIL] GROQ_API_KEY missing in .env")
         return
 
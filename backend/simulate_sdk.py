@@ -1,19 +1,27 @@
 
 import asyncio
+import functools
 import os
 import sys
 from dotenv import load_dotenv
-from typing import AsyncGenerator
+from typing import AsyncGenerator, ClassVar
 
-# Force UTF-8 for Windows Console
-sys.stdout.reconfigure(encoding='utf-8')
+# Populated by _bootstrap() when run as a script
+GEMINI_API_KEY = None
 
-# Force load .env for testing
-load_dotenv(dotenv_path="backend/.env")
+def _bootstrap():
+    """Script-only side effects, kept out of import time."""
+    global GEMINI_API_KEY
 
-# Check environment
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-print(f"[SIMULATION] GEMINI_API_KEY Found? {'YES' if GEMINI_API_KEY else 'NO'}")
+    # Force UTF-8 for Windows Console
+    sys.stdout.reconfigure(encoding='utf-8')
+
+    # Force load .env for testing
+    load_dotenv(dotenv_path="backend/.env")
+
+    # Check environment
+    GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+    print(f"[SIMULATION] GEMINI_API_KEY Found? {'YES' if GEMINI_API_KEY else 'NO'}")
 
 # --- MOCKING THE NEW SDK FOR DRY RUN (Since user has no Python/Internet access for real call) ---
 # In a real environment, we would import: from google import genai
@@ -40,24 +48,29 @@ class GenAiClientMock:
                     yield type('obj', (object,), {'text': part})
                     await asyncio.sleep(0.1)
 
+@functools.lru_cache(maxsize=4)
+def _get_client(api_key: str) -> GenAiClientMock:
+    # One client (one channel) per key, shared across engine instances
+    return GenAiClientMock(api_key=api_key)
+
 # --- REPLICATING ENGINE LOGIC FROM agent_engine.py ---
 class TiryaqEngine:
+    # Shared by every engine instance - built once at class definition
+    _SYSTEM_PROMPT: ClassVar[str] = "You are Tiryaq, speak Saudi Dialect..."
+
     def __init__(self):
-        self.system_prompt = self._load_system_prompt()
+        self.system_prompt = self._SYSTEM_PROMPT
         if GEMINI_API_KEY:
-            self.client = GenAiClientMock(api_key=GEMINI_API_KEY)
+            self.client = _get_client(GEMINI_API_KEY)
         else:
             self.client = None
 
-    def _load_system_prompt(self) -> str:
-        return "You are Tiryaq, speak Saudi Dialect..."
-
     async def process_audio_stream(self, audio_chunks: AsyncGenerator[bytes, None], context: dict):
-        full_audio = b""
+        full_audio = bytearray()
         async for chunk in audio_chunks:
-            full_audio += chunk
+            full_audio.extend(chunk)
         
-        user_text = await self._stt_stub(full_audio)
+        user_text = await self._stt_stub(bytes(full_audio))
         print(f"[SIMULATION] User Said: {user_text}")
 
         if self.client:
@@ -66,16 +79,33 @@ class TiryaqEngine:
             
             final_prompt = f"User Context: {context}\nUser said: {user_text}"
             
-            async for chunk in self.client.aio.models.generate_content_stream(
+            stream = self.client.aio.models.generate_content_stream(
                 model="gemini-1.5-flash", 
                 contents=final_prompt,
                 config=config
-            ):
-                if chunk.text:
-                    yield chunk.text
+            )
+            queue = asyncio.Queue(maxsize=8)
+            producer = asyncio.create_task(self._pump(stream, queue))
+            try:
+                while (chunk := await queue.get()) is not None:
+                    if chunk.text:
+                        yield chunk.text
+                await producer  # Surface producer errors
+            finally:
+                producer.cancel()
         else:
             yield "NO_API_KEY_FOUND_ERROR"
 
+    async def _pump(self, stream, queue: asyncio.Queue):
+        # Producer: drain the LLM stream so the consumer (TTS) can overlap decode
+        try:
+            async for part in stream:
+                await queue.put(part)
+        except Exception:
+            await queue.put(None)
+            raise
+        await queue.put(None)
+
     async def _stt_stub(self, audio_data: bytes) -> str:
         return "أبغى أحجز موعد"
 
@@ -83,6 +113,7 @@ async def mock_audio_generator():
     yield b"AUDIO_DATA"
 
 async def main():
+    _bootstrap()
     print("--- STARTING GENAI SDK MIGRATION TEST ---")
     engine = TiryaqEngine()
     
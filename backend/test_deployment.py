@@ -8,17 +8,27 @@ Tests:
 3. Echo endpoint functionality
 4. Multi-tenant engine initialization
 5. Memory manager fallback validation
+6. OpenAI API key authentication
 
 Run: python test_deployment.py
 """
 
 import asyncio
+import hashlib
+import importlib
+import importlib.metadata
 import json
+import re
+import socket
+import ssl
 import sys
 import time
 import traceback
+from contextvars import ContextVar
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Dict, List
+from types import ModuleType
+from typing import Dict, List, Optional, Tuple, Union
 
 # Windows console encoding fix
 if sys.platform == "win32":
@@ -26,9 +36,30 @@ if sys.platform == "win32":
 
 # Ensure backend directory is in path
 BACKEND_DIR = Path(__file__).parent.resolve()
-if str(BACKEND_DIR) not in sys.path:
+# Compare resolved paths so "backend" / "./backend" don't end up listed twice
+if BACKEND_DIR not in {Path(p).resolve() for p in sys.path if p}:
     sys.path.insert(0, str(BACKEND_DIR))
 
+# Monotonic, ns-resolution clock for test durations
+_PC = time.perf_counter_ns
+
+# Flush small request writes immediately rather than waiting on Nagle. asyncio
+# already sets this on its own TCP transports (the WebSocket probes); httpx
+# gets it explicitly through the transport.
+_NODELAY = [(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)]
+
+
+def _tls_context() -> ssl.SSLContext:
+    """Client TLS context shared by a tester's probes (HTTPS ingress in CI)."""
+    ctx = ssl.create_default_context()
+    ctx.set_alpn_protocols(["http/1.1"])
+    return ctx
+
+
+# Successful import probes are remembered for a few minutes between runs
+IMPORT_CACHE_PATH = BACKEND_DIR / ".import_check_cache.json"
+IMPORT_CACHE_TTL = 300
+
 try:
     import httpx
     import websockets
@@ -36,28 +67,115 @@ except ImportError:
     print("[ERROR] Missing test dependencies. Install with: pip install httpx websockets")
     sys.exit(1)
 
+def _import_all(names: Tuple[str, ...]) -> Dict[str, Union[ModuleType, Exception]]:
+    loaded: Dict[str, Union[ModuleType, Exception]] = {}
+    for name in names:
+        try:
+            loaded[name] = importlib.import_module(name)
+        except Exception as e:
+            loaded[name] = e
+    return loaded
+
+
+def _import_serially(*names: str) -> "asyncio.Task[Dict[str, Union[ModuleType, Exception]]]":
+    """Start importing `names` one after another on a single worker thread.
+    
+    Never import these from several threads at once: openai, groq and pydantic
+    race on partially initialized modules.
+    """
+    return asyncio.create_task(asyncio.to_thread(_import_all, names))
+
+
+async def _loaded(modules: "asyncio.Task[Dict[str, Union[ModuleType, Exception]]]", name: str) -> ModuleType:
+    """Module `name` from an _import_serially batch; re-raises its import error."""
+    module = (await modules)[name]
+    if isinstance(module, Exception):
+        raise module
+    return module
+
+
+# Response bodies are parsed straight from bytes
+try:
+    from orjson import loads as _loads
+except ImportError:
+    from json import loads as _loads
+
+# /health has a small fixed schema; pull the two fields without a full parse
+_HEALTH_STATUS_RE = re.compile(rb'"status"\s*:\s*"([^"]*)"')
+_HEALTH_VERSION_RE = re.compile(rb'"version"\s*:\s*"([^"]*)"')
+
+# Per-task output buffer so concurrently run tests still print in a fixed order
+_output: ContextVar[Optional[List[str]]] = ContextVar("test_output", default=None)
+
+
+@dataclass(slots=True)
+class TestResult:
+    """One recorded check. success is None for a skipped test."""
+    __test__ = False  # not a pytest test class
+    
+    test: str
+    success: Optional[bool]
+    message: str = ""
+    duration_ms: float = 0.0
+
 
 class DeploymentTester:
     """Comprehensive deployment validation suite."""
     
+    IMPORT_MODULES = (
+        "fastapi",
+        "uvicorn",
+        "websockets",
+        "openai",
+        "groq",
+        "aiohttp",
+        "loguru",
+        "tenacity",
+        "pydantic_settings",
+        "config",
+        "services.agent_engine",
+        "services.firestore_memory",
+    )
+    
     def __init__(self, host: str = "localhost", port: int = 8000):
         self.host = host
         self.port = port
         self.base_url = f"http://{host}:{port}"
         self.ws_url = f"ws://{host}:{port}"
-        self.results: List[Dict] = []
+        self.results: List[TestResult] = []
         self.passed = 0
         self.failed = 0
+        self.skipped = 0
+        # Set from the preflight probe; when False the network phases are skipped
+        self.server_up = True
+        self._client: Optional[httpx.AsyncClient] = None
+        self._tls = _tls_context()
+        # Result lines are written out once per phase, not once per print
+        self._out_buffer: List[str] = []
+    
+    async def __aenter__(self) -> "DeploymentTester":
+        # One pooled client for every HTTP probe: keep-alive instead of a new
+        # TCP connect per test.
+        self._client = httpx.AsyncClient(
+            base_url=self.base_url,
+            timeout=10.0,
+            transport=httpx.AsyncHTTPTransport(
+                verify=self._tls,
+                socket_options=_NODELAY,
+                limits=httpx.Limits(max_keepalive_connections=4),
+            ),
+        )
+        return self
+    
+    async def __aexit__(self, *exc_info):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
     
     def log_result(self, test_name: str, success: bool, message: str = "", duration_ms: float = 0):
         """Record test result."""
         status = "[PASS]" if success else "[FAIL]"
-        self.results.append({
-            "test": test_name,
-            "success": success,
-            "message": message,
-            "duration_ms": duration_ms
-        })
+        self.results.append(TestResult(test_name, success, message, duration_ms))
         
         if success:
             self.passed += 1
@@ -65,94 +183,138 @@ class DeploymentTester:
             self.failed += 1
         
         duration_str = f" ({duration_ms:.0f}ms)" if duration_ms > 0 else ""
-        print(f"  {status}: {test_name}{duration_str}")
+        self._emit(f"  {status}: {test_name}{duration_str}")
         if message:
-            print(f"         {message}")
+            self._emit(f"         {message}")
+    
+    def log_skip(self, test_name: str, reason: str):
+        """Record a test that was not run."""
+        self.results.append(TestResult(test_name, None, reason))
+        self.skipped += 1
+        self._emit(f"  [SKIP]: {test_name}")
+        self._emit(f"         {reason}")
+    
+    def _emit(self, line: str):
+        buffer = _output.get()
+        (self._out_buffer if buffer is None else buffer).append(line + "\n")
+    
+    def _flush_output(self):
+        sys.stdout.write("".join(self._out_buffer))
+        sys.stdout.flush()
+        self._out_buffer.clear()
+    
+    @staticmethod
+    async def _captured(test) -> Tuple[bool, List[str]]:
+        # Runs inside its own gather() task, so the ContextVar is task-local
+        buffer: List[str] = []
+        _output.set(buffer)
+        return await test, buffer
+    
+    async def _run_concurrently(self, *tests) -> List[bool]:
+        """Run independent tests together; buffer their output in argument order."""
+        outcomes = await asyncio.gather(*(self._captured(t) for t in tests))
+        for _, lines in outcomes:
+            self._out_buffer.extend(lines)
+        return [ok for ok, _ in outcomes]
     
     async def test_health_endpoint(self) -> bool:
         """Test /health endpoint returns valid response."""
-        start = time.time()
+        start = _PC()
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                response = await client.get(f"{self.base_url}/health")
-                
-                if response.status_code != 200:
-                    self.log_result("Health Endpoint", False, f"Status: {response.status_code}")
-                    return False
-                
-                data = response.json()
-                if data.get("status") != "healthy":
-                    self.log_result("Health Endpoint", False, f"Invalid status: {data}")
-                    return False
-                
-                duration = (time.time() - start) * 1000
-                self.log_result("Health Endpoint", True, f"Version: {data.get('version', 'unknown')}", duration)
-                return True
-                
+            response = await self._client.get("/health")
+            
+            if response.status_code != 200:
+                self.log_result("Health Endpoint", False, f"Status: {response.status_code}")
+                return False
+            
+            body = response.content
+            status_match = _HEALTH_STATUS_RE.search(body)
+            if status_match is not None:
+                status = status_match.group(1).decode()
+                version_match = _HEALTH_VERSION_RE.search(body)
+                version = version_match.group(1).decode() if version_match else "unknown"
+            else:
+                # Unexpected shape: fall back to a full parse
+                data = _loads(body)
+                status, version = data.get("status"), data.get("version", "unknown")
+            
+            if status != "healthy":
+                self.log_result("Health Endpoint", False, f"Invalid status: {body.decode(errors='replace')}")
+                return False
+            
+            duration = (_PC() - start) / 1_000_000
+            self.log_result("Health Endpoint", True, f"Version: {version}", duration)
+            return True
+            
         except Exception as e:
             self.log_result("Health Endpoint", False, str(e))
             return False
     
     async def test_debug_endpoint(self) -> bool:
         """Test /ws/debug endpoint for environment info."""
-        start = time.time()
+        start = _PC()
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                response = await client.get(f"{self.base_url}/ws/debug")
-                
-                if response.status_code != 200:
-                    self.log_result("Debug Endpoint", False, f"Status: {response.status_code}")
-                    return False
-                
-                data = response.json()
-                duration = (time.time() - start) * 1000
-                self.log_result("Debug Endpoint", True, f"Mode: {data.get('mode', 'unknown')}", duration)
-                return True
-                
+            response = await self._client.get("/ws/debug")
+            
+            if response.status_code != 200:
+                self.log_result("Debug Endpoint", False, f"Status: {response.status_code}")
+                return False
+            
+            data = _loads(response.content)
+            duration = (_PC() - start) / 1_000_000
+            self.log_result("Debug Endpoint", True, f"Mode: {data.get('mode', 'unknown')}", duration)
+            return True
+            
         except Exception as e:
             self.log_result("Debug Endpoint", False, str(e))
             return False
     
     async def test_root_endpoint(self) -> bool:
         """Test / endpoint returns valid response."""
-        start = time.time()
+        start = _PC()
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                response = await client.get(f"{self.base_url}/")
-                
-                if response.status_code != 200:
-                    self.log_result("Root Endpoint", False, f"Status: {response.status_code}")
-                    return False
-                
-                # Could be HTML or JSON
-                content_type = response.headers.get("content-type", "")
-                duration = (time.time() - start) * 1000
-                
-                if "html" in content_type:
-                    self.log_result("Root Endpoint", True, "Serving HTML frontend", duration)
-                else:
-                    data = response.json()
-                    self.log_result("Root Endpoint", True, f"JSON: {data.get('message', 'ok')}", duration)
-                return True
-                
+            response = await self._client.get("/")
+            
+            if response.status_code != 200:
+                self.log_result("Root Endpoint", False, f"Status: {response.status_code}")
+                return False
+            
+            # Could be HTML or JSON
+            content_type = response.headers.get("content-type", "")
+            duration = (_PC() - start) / 1_000_000
+            
+            if "html" in content_type:
+                self.log_result("Root Endpoint", True, "Serving HTML frontend", duration)
+            else:
+                data = _loads(response.content)
+                self.log_result("Root Endpoint", True, f"JSON: {data.get('message', 'ok')}", duration)
+            return True
+            
         except Exception as e:
             self.log_result("Root Endpoint", False, str(e))
             return False
     
     async def test_websocket_echo(self) -> bool:
         """Test /ws/echo WebSocket endpoint."""
-        start = time.time()
+        start = _PC()
         try:
             async with websockets.connect(
                 f"{self.ws_url}/ws/echo",
                 ping_timeout=5,
-                close_timeout=5
+                close_timeout=5,
+                compression=None,
+                max_size=2**16,
+                open_timeout=5
             ) as ws:
-                # Wait for server response
-                response = await asyncio.wait_for(ws.recv(), timeout=5.0)
+                # Handshake is bounded by open_timeout; this only covers the payload
+                try:
+                    response = await asyncio.wait_for(ws.recv(), timeout=2.0)
+                except asyncio.TimeoutError:
+                    self.log_result("WebSocket Echo", False, "Timeout waiting for response")
+                    return False
                 
                 if response == "HANDSHAKE_SUCCESS":
-                    duration = (time.time() - start) * 1000
+                    duration = (_PC() - start) / 1_000_000
                     self.log_result("WebSocket Echo", True, "Handshake successful", duration)
                     return True
                 else:
@@ -160,7 +322,7 @@ class DeploymentTester:
                     return False
                     
         except asyncio.TimeoutError:
-            self.log_result("WebSocket Echo", False, "Timeout waiting for response")
+            self.log_result("WebSocket Echo", False, "Handshake timeout")
             return False
         except Exception as e:
             self.log_result("WebSocket Echo", False, str(e))
@@ -168,19 +330,22 @@ class DeploymentTester:
     
     async def test_websocket_session(self) -> bool:
         """Test /ws/session/{tenant_id}/{user_id} WebSocket endpoint."""
-        start = time.time()
+        start = _PC()
         try:
             uri = f"{self.ws_url}/ws/session/test_tenant/test_user"
             
             async with websockets.connect(
                 uri,
                 ping_timeout=10,
-                close_timeout=5
+                close_timeout=5,
+                compression=None,
+                max_size=2**16,
+                open_timeout=5
             ) as ws:
                 # Wait for connection confirmation (should receive state message)
                 try:
                     response = await asyncio.wait_for(ws.recv(), timeout=5.0)
-                    duration = (time.time() - start) * 1000
+                    duration = (_PC() - start) / 1_000_000
                     
                     # Connection established successfully
                     self.log_result("WebSocket Session", True, f"Connected to tenant session", duration)
@@ -188,10 +353,13 @@ class DeploymentTester:
                     
                 except asyncio.TimeoutError:
                     # No immediate response is OK - connection is established
-                    duration = (time.time() - start) * 1000
+                    duration = (_PC() - start) / 1_000_000
                     self.log_result("WebSocket Session", True, "Connection established (no initial message)", duration)
                     return True
                     
+        except asyncio.TimeoutError:
+            self.log_result("WebSocket Session", False, "Handshake timeout")
+            return False
         except Exception as e:
             error_msg = str(e)
             if "4001" in error_msg:
@@ -200,16 +368,18 @@ class DeploymentTester:
                 self.log_result("WebSocket Session", False, error_msg)
             return False
     
-    async def test_memory_manager(self) -> bool:
+    async def test_memory_manager(self, modules: Optional[asyncio.Task] = None) -> bool:
         """Test MemoryManager initialization and fallback."""
-        start = time.time()
+        start = _PC()
         try:
-            from services.firestore_memory import MemoryManager
+            if modules is None:
+                modules = _import_serially("services.firestore_memory")
+            MemoryManager = (await _loaded(modules, "services.firestore_memory")).MemoryManager
             
             manager = MemoryManager()
             status = manager.get_status()
             
-            duration = (time.time() - start) * 1000
+            duration = (_PC() - start) / 1_000_000
             
             if status["storage_type"] == "in_memory":
                 self.log_result("Memory Manager", True, "Using in-memory fallback (Firestore unavailable)", duration)
@@ -228,11 +398,13 @@ class DeploymentTester:
             self.log_result("Memory Manager", False, str(e))
             return False
     
-    async def test_engine_initialization(self) -> bool:
+    async def test_engine_initialization(self, modules: Optional[asyncio.Task] = None) -> bool:
         """Test GroqEngine initialization with tenant database."""
-        start = time.time()
+        start = _PC()
         try:
-            from services.agent_engine import GroqEngine
+            if modules is None:
+                modules = _import_serially("services.agent_engine")
+            GroqEngine = (await _loaded(modules, "services.agent_engine")).GroqEngine
             
             # Test with default tenant
             engine = GroqEngine(tenant_id="tiryaq")
@@ -248,7 +420,7 @@ class DeploymentTester:
                 self.log_result("Engine Init", False, "System prompt missing Saudi persona")
                 return False
             
-            duration = (time.time() - start) * 1000
+            duration = (_PC() - start) / 1_000_000
             self.log_result("Engine Init", True, f"Tenant: {engine.db.get('tenant_name', 'unknown')}", duration)
             return True
             
@@ -262,39 +434,120 @@ class DeploymentTester:
             self.log_result("Engine Init", False, str(e))
             return False
     
-    async def test_import_paths(self) -> bool:
-        """Test all critical imports work correctly."""
-        start = time.time()
-        failed_imports = []
+    @staticmethod
+    def _import_cache_key() -> str:
+        """Changes when the interpreter, installed packages or local sources do."""
+        local = sorted(
+            f"{p.name}:{p.stat().st_mtime_ns}"
+            for p in [BACKEND_DIR / "config.py", *BACKEND_DIR.glob("services/*.py")]
+        )
+        packages = sorted(
+            f"{dist.metadata['Name']}=={dist.version}"
+            for dist in importlib.metadata.distributions()
+        )
+        raw = "|".join([
+            sys.version,
+            str(Path(sys.executable).stat().st_mtime_ns),
+            *packages,
+            *local,
+        ])
+        return hashlib.sha1(raw.encode()).hexdigest()
+    
+    async def _probe_imports(self) -> List[str]:
+        """Import IMPORT_MODULES in a child interpreter; return the failures.
+        
+        Keeps fastapi/openai/groq out of the tester's own process and lets the
+        cold imports overlap with the network tests. A clean result is reused
+        from IMPORT_CACHE_PATH while the cache key matches and the TTL holds.
+        """
+        # Walks every installed distribution's metadata; keep it off the loop
+        # so Phase 1 isn't held up behind it
+        key = await asyncio.to_thread(self._import_cache_key)
+        try:
+            cached = json.loads(IMPORT_CACHE_PATH.read_text())
+            if (cached.get("key") == key and not cached.get("failed")
+                    and cached.get("ts", 0) > time.time() - IMPORT_CACHE_TTL):
+                return []
+        except (OSError, ValueError):
+            pass
         
-        modules = [
-            "fastapi",
-            "uvicorn",
-            "websockets",
-            "openai",
-            "groq",
-            "aiohttp",
-            "loguru",
-            "tenacity",
-            "pydantic_settings",
-            "config",
-            "services.agent_engine",
-            "services.firestore_memory",
+        # Serial on purpose: importing these packages from several threads at
+        # once trips over partially initialized modules (openai, pydantic.v1)
+        script = (
+            "import importlib\n"
+            f"for m in {self.IMPORT_MODULES!r}:\n"
+            "    try: importlib.import_module(m)\n"
+            "    except Exception as e: print('FAIL', m + ':', ' '.join(str(e).split()))\n"
+        )
+        proc = await asyncio.create_subprocess_exec(
+            sys.executable, "-c", script,
+            cwd=str(BACKEND_DIR),
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        stdout, stderr = await proc.communicate()
+        failed = [
+            line[5:] for line in stdout.decode(errors="replace").splitlines()
+            if line.startswith("FAIL ")
         ]
+        if proc.returncode != 0 and not failed:
+            tail = stderr.decode(errors="replace").strip().splitlines()[-1:]
+            failed.append(f"probe exited {proc.returncode}: {''.join(tail)}")
         
-        for module in modules:
-            try:
-                __import__(module)
-            except ImportError as e:
-                failed_imports.append(f"{module}: {e}")
+        try:
+            IMPORT_CACHE_PATH.write_text(json.dumps({"key": key, "ts": time.time(), "failed": failed}))
+        except OSError:
+            pass
+        return failed
+    
+    async def test_openai_key(self, modules: Optional[asyncio.Task] = None) -> bool:
+        """Test OPENAI_API_KEY authenticates (one small models.retrieve GET)."""
+        start = _PC()
+        try:
+            if modules is None:
+                modules = _import_serially("openai", "config")
+            openai = await _loaded(modules, "openai")
+            settings = (await _loaded(modules, "config")).settings
+            AsyncOpenAI, AuthenticationError = openai.AsyncOpenAI, openai.AuthenticationError
+        except Exception as e:
+            self.log_result("OpenAI Key", False, str(e))
+            return False
+        
+        if not settings.OPENAI_API_KEY:
+            self.log_result("OpenAI Key", False, "OPENAI_API_KEY not configured")
+            return False
+        
+        client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY, timeout=10.0)
+        try:
+            await client.models.retrieve("whisper-1")
+            duration = (_PC() - start) / 1_000_000
+            self.log_result("OpenAI Key", True, "Authenticated", duration)
+            return True
+        except AuthenticationError:
+            self.log_result("OpenAI Key", False, "Invalid or revoked API key")
+            return False
+        except Exception as e:
+            self.log_result("OpenAI Key", False, str(e))
+            return False
+        finally:
+            await client.close()
+    
+    async def test_import_paths(self, probe: Optional["asyncio.Task[List[str]]"] = None) -> bool:
+        """Test all critical imports work correctly."""
+        start = _PC()
+        try:
+            failed_imports = await (probe if probe is not None else self._probe_imports())
+        except Exception as e:
+            self.log_result("Import Paths", False, str(e))
+            return False
         
-        duration = (time.time() - start) * 1000
+        duration = (_PC() - start) / 1_000_000
         
         if failed_imports:
             self.log_result("Import Paths", False, f"Failed: {', '.join(failed_imports)}")
             return False
         else:
-            self.log_result("Import Paths", True, f"All {len(modules)} modules imported", duration)
+            self.log_result("Import Paths", True, f"All {len(self.IMPORT_MODULES)} modules imported", duration)
             return True
     
     async def run_all_tests(self):
@@ -305,22 +558,51 @@ class DeploymentTester:
         print(f"Target: {self.base_url}")
         print("-"*60 + "\n")
         
+        # Cold imports run in a child process while the network tests go
+        import_probe = asyncio.create_task(self._probe_imports())
+        
         # Phase 1: Basic connectivity
         print("Phase 1: HTTP Endpoints")
-        await self.test_health_endpoint()
-        await self.test_debug_endpoint()
-        await self.test_root_endpoint()
+        if self.server_up:
+            await self._run_concurrently(
+                self.test_health_endpoint(),
+                self.test_debug_endpoint(),
+                self.test_root_endpoint(),
+            )
+        else:
+            for name in ("Health Endpoint", "Debug Endpoint", "Root Endpoint"):
+                self.log_skip(name, "Server not running")
+        self._flush_output()
         
         # Phase 2: WebSocket
         print("\nPhase 2: WebSocket Connections")
-        await self.test_websocket_echo()
-        await self.test_websocket_session()
+        # Service modules (and openai for the key check) load off the event
+        # loop while the sockets are open
+        service_modules = _import_serially(
+            "services.firestore_memory", "services.agent_engine", "openai", "config"
+        )
+        if self.server_up:
+            await self._run_concurrently(
+                self.test_websocket_echo(),
+                self.test_websocket_session(),
+            )
+        else:
+            for name in ("WebSocket Echo", "WebSocket Session"):
+                self.log_skip(name, "Server not running")
+        self._flush_output()
         
         # Phase 3: Backend services
         print("\nPhase 3: Backend Services")
-        await self.test_import_paths()
-        await self.test_memory_manager()
-        await self.test_engine_initialization()
+        await self.test_import_paths(import_probe)
+        # Let the service imports finish before anything else imports
+        await asyncio.wait([service_modules])
+        # The OpenAI round-trip overlaps memory and engine setup
+        await self._run_concurrently(
+            self.test_memory_manager(service_modules),
+            self.test_engine_initialization(service_modules),
+            self.test_openai_key(service_modules),
+        )
+        self._flush_output()
         
         # Summary
         print("\n" + "="*60)
@@ -330,26 +612,39 @@ class DeploymentTester:
         print(f"  Total Tests: {total}")
         print(f"  Passed:      {self.passed}")
         print(f"  Failed:      {self.failed}")
+        if self.skipped:
+            print(f"  Skipped:     {self.skipped}")
         print(f"  Success Rate: {(self.passed/total*100):.1f}%" if total > 0 else "N/A")
         print("="*60)
         
         if self.failed > 0:
             print("\nFAILED TESTS:")
             for r in self.results:
-                if not r["success"]:
-                    print(f"  - {r['test']}: {r['message']}")
+                if r.success is False:
+                    print(f"  - {r.test}: {r.message}")
         
-        return self.failed == 0
+        # A down server is still a failed deployment, even if Phase 3 passes
+        return self.server_up and self.failed == 0
 
 
 async def check_server_running(host: str = "localhost", port: int = 8000) -> bool:
-    """Check if server is already running."""
+    """Check if server is already running.
+    
+    A bare HTTP/1.0 GET over asyncio streams: one loopback round-trip with no
+    client, pool or header parsing behind it.
+    """
+    writer = None
     try:
-        async with httpx.AsyncClient(timeout=2.0) as client:
-            response = await client.get(f"http://{host}:{port}/health")
-            return response.status_code == 200
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout=2.0)
+        writer.write(b"GET /health HTTP/1.0\r\nHost: %b\r\n\r\n" % host.encode())
+        await writer.drain()
+        status_line = await asyncio.wait_for(reader.readline(), timeout=2.0)
+        return b" 200 " in status_line
     except:
         return False
+    finally:
+        if writer is not None:
+            writer.close()
 
 
 async def main():
@@ -362,25 +657,26 @@ async def main():
     parser.add_argument("--start-server", action="store_true", help="Start server before testing")
     args = parser.parse_args()
     
-    # Check if server is running
-    if not await check_server_running(args.host, args.port):
-        if args.start_server:
-            print("[INFO] Starting server...")
-            # Server would be started here in a subprocess
-            # For now, just warn the user
-            print(f"[WARN] Server not running at {args.host}:{args.port}")
-            print("   Please start the server first: cd backend && python main.py")
-            print("   Or run with uvicorn: uvicorn main:app --host 0.0.0.0 --port 8000")
-        else:
-            print(f"[ERROR] Server not running at {args.host}:{args.port}")
-            print("   Start with: cd backend && python main.py")
-            print("   Or pass --start-server flag")
+    async with DeploymentTester(args.host, args.port) as tester:
+        # Check if server is running
+        tester.server_up = await check_server_running(args.host, args.port)
+        if not tester.server_up:
+            if args.start_server:
+                print("[INFO] Starting server...")
+                # Server would be started here in a subprocess
+                # For now, just warn the user
+                print(f"[WARN] Server not running at {args.host}:{args.port}")
+                print("   Please start the server first: cd backend && python main.py")
+                print("   Or run with uvicorn: uvicorn main:app --host 0.0.0.0 --port 8000")
+            else:
+                print(f"[ERROR] Server not running at {args.host}:{args.port}")
+                print("   Start with: cd backend && python main.py")
+                print("   Or pass --start-server flag")
+            
+            # Skip the network tests rather than wait out their timeouts
+            print("\n[WARN] Skipping server tests; running backend checks only...\n")
         
-        # Run tests anyway (some will fail but we get partial results)
-        print("\n[WARN] Running tests anyway (some will fail)...\n")
-    
-    tester = DeploymentTester(args.host, args.port)
-    success = await tester.run_all_tests()
+        success = await tester.run_all_tests()
     
     sys.exit(0 if success else 1)
 
@@ -1,47 +1,76 @@
 """
 Quick test script to verify OpenAI Whisper API key works
+
+Run: python test_openai_key.py [--list-models]
 """
+import argparse
+import asyncio
 import os
-from dotenv import load_dotenv
-from openai import OpenAI
+import re
+
+# Case-insensitive match without lowercasing every model id
+WHISPER = re.compile(r"whisper", re.IGNORECASE).search
 
-# Load environment variables
-load_dotenv()
+parser = argparse.ArgumentParser(description="Verify the OpenAI Whisper API key")
+parser.add_argument("--list-models", action="store_true", help="Also list available Whisper models")
+args = parser.parse_args()
 
+# Only scan .env when the key isn't already exported (e.g. in CI)
 api_key = os.getenv("OPENAI_API_KEY")
+if not api_key:
+    from dotenv import load_dotenv
+    load_dotenv()
+    api_key = os.getenv("OPENAI_API_KEY")
 
 print("=" * 60)
 print("OPENAI WHISPER API KEY TEST")
 print("=" * 60)
 
 if not api_key:
-    print("❌ OPENAI_API_KEY not found in .env")
+    print("❌ OPENAI_API_KEY not found in environment or .env")
     exit(1)
 
+# Deferred so a missing key exits before paying for the openai import
+from openai import AsyncOpenAI, AuthenticationError
+
 print(f"✅ API Key found: {api_key[:20]}...{api_key[-4:]}")
 print("\nTesting API connection...")
 
-try:
-    client = OpenAI(api_key=api_key)
-    
-    # List models to test authentication
-    models = client.models.list()
-    
-    print("✅ Authentication successful!")
-    print(f"✅ API key is valid")
-    print("\nAvailable Whisper models:")
-    for model in models:
-        if 'whisper' in model.id.lower():
-            print(f"  - {model.id}")
-    
-    print("\n" + "=" * 60)
-    print("✅ OPENAI_API_KEY is working correctly!")
-    print("=" * 60)
-    
-except Exception as e:
-    print(f"\n❌ API Test Failed: {e}")
-    print("\nPossible issues:")
-    print("1. API key is invalid or expired")
-    print("2. No internet connection")
-    print("3. OpenAI service is down")
+
+async def check_key() -> bool:
+    """Authenticate against the API; optionally list Whisper models."""
+    client = AsyncOpenAI(api_key=api_key)
+    try:
+        # One small GET authenticates the key; no need to pull the whole catalog
+        await client.models.retrieve("whisper-1")
+        
+        print("✅ Authentication successful!")
+        print(f"✅ API key is valid")
+        if args.list_models:
+            print("\nAvailable Whisper models:")
+            whisper_ids = sorted([model.id async for model in client.models.list() if WHISPER(model.id)])
+            if whisper_ids:
+                print("\n".join(f"  - {model_id}" for model_id in whisper_ids))
+        
+        print("\n" + "=" * 60)
+        print("✅ OPENAI_API_KEY is working correctly!")
+        print("=" * 60)
+        return True
+        
+    except AuthenticationError as e:
+        print(f"\n❌ Authentication failed: {e}")
+        print("\nThe API key is invalid, expired or revoked.")
+        return False
+    except Exception as e:
+        print(f"\n❌ API Test Failed: {e}")
+        print("\nPossible issues:")
+        print("1. API key is invalid or expired")
+        print("2. No internet connection")
+        print("3. OpenAI service is down")
+        return False
+    finally:
+        await client.close()
+
+
+if not asyncio.run(check_key()):
     exit(1)